@@ -4,9 +4,76 @@ This script demonstrates how to sync with an Anki instance using AnkiConnect.
 Requires: AnkiConnect add-on installed in Anki (https://ankiweb.net/shared/info/2055492159)
 """
 
+import base64
+import datetime
+import http.client
 import json
+import os
+import time
 import urllib.request
 import urllib.error
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+
+# Bytes read from disk per base64 chunk of a media upload
+MEDIA_CHUNK_SIZE = 768 * 1024
+
+# Numeric fields of a getDeckStats entry
+DECK_STATS_COUNTS = ("new_count", "learn_count", "review_count", "total_in_deck")
+
+
+@dataclass
+class DeckStatsDiff:
+    """Changes between two deck statistics snapshots"""
+    added: List[int] = field(default_factory=list)
+    removed: List[int] = field(default_factory=list)
+    changed: Dict[int, Dict[str, int]] = field(default_factory=dict)  # deck id -> count deltas
+
+
+@dataclass
+class DeckStatsSnapshot:
+    """Statistics of all decks at a point in time, keyed by deck id"""
+    taken_at: float  # Unix timestamp
+    stats: Dict[int, Dict]
+    ids_by_name: Dict[str, int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.ids_by_name = {
+            deck_stats["name"]: deck_id
+            for deck_id, deck_stats in self.stats.items()
+            if "name" in deck_stats
+        }
+
+    def get_by_name(self, deck_name):
+        """Get the statistics of a deck by name, None if it is not in the snapshot"""
+        deck_id = self.ids_by_name.get(deck_name)
+        return None if deck_id is None else self.stats[deck_id]
+
+    def diff(self, newer):
+        """Get the changes from this snapshot to a newer one"""
+        result = DeckStatsDiff(
+            added=[deck_id for deck_id in newer.stats if deck_id not in self.stats],
+            removed=[deck_id for deck_id in self.stats if deck_id not in newer.stats],
+        )
+
+        for deck_id, old_stats in self.stats.items():
+            new_stats = newer.stats.get(deck_id)
+            if new_stats is None:
+                continue
+            deltas = {
+                name: new_stats.get(name, 0) - old_stats.get(name, 0)
+                for name in DECK_STATS_COUNTS
+                if new_stats.get(name, 0) != old_stats.get(name, 0)
+            }
+            if deltas:
+                result.changed[deck_id] = deltas
+
+        return result
+
+
+class AnkiConnectionError(Exception):
+    """Raised when Anki cannot be reached, as opposed to Anki refusing a request"""
 
 
 class AnkiConnector:
@@ -24,11 +91,12 @@ class AnkiConnector:
             "params": params
         }).encode('utf-8')
         
+        return self._send(urllib.request.Request(self.url, request_json))
+    
+    def _send(self, request):
+        """Send a prepared request to AnkiConnect and return its result"""
         try:
-            response = urllib.request.urlopen(
-                urllib.request.Request(self.url, request_json),
-                timeout=10
-            )
+            response = urllib.request.urlopen(request, timeout=10)
             response_data = json.loads(response.read().decode('utf-8'))
             
             if len(response_data) != 2:
@@ -43,7 +111,10 @@ class AnkiConnector:
             return response_data['result']
         
         except urllib.error.URLError as e:
-            raise Exception(f"Failed to connect to Anki. Make sure Anki is running with AnkiConnect installed: {e}")
+            raise AnkiConnectionError(f"Failed to connect to Anki. Make sure Anki is running with AnkiConnect installed: {e}")
+        except (OSError, http.client.HTTPException) as e:
+            # Dropped or timed out after the request was sent; Anki may have applied it
+            raise AnkiConnectionError(f"Lost the connection to Anki: {e!r}")
     
     def check_connection(self):
         """Verify connection to Anki"""
@@ -61,7 +132,23 @@ class AnkiConnector:
     
     def get_deck_stats(self, deck_name):
         """Get statistics for a specific deck"""
-        return self._invoke("getDeckStats", decks=deck_name)
+        stats = self._invoke("getDeckStats", decks=[deck_name])
+        return next(iter(stats.values()), {})
+
+    def get_deck_stats_snapshot(self, deck_names=None):
+        """
+        Get statistics for many decks (all decks by default) with a single getDeckStats request.
+
+        Returns:
+            DeckStatsSnapshot keyed by deck id
+        """
+        if deck_names is None:
+            deck_names = self.get_deck_names()
+        stats = self._invoke("getDeckStats", decks=list(deck_names)) if deck_names else {}
+        return DeckStatsSnapshot(
+            taken_at=time.time(),
+            stats={int(deck_id): deck_stats for deck_id, deck_stats in stats.items()}
+        )
     
     def find_notes(self, query):
         """Find notes matching a query"""
@@ -71,12 +158,12 @@ class AnkiConnector:
         """Get detailed information about notes"""
         return self._invoke("notesInfo", notes=note_ids)
     
-    def add_note(self, deck_name, front, back, tags=None):
-        """Add a new note to a deck"""
+    def build_note(self, deck_name, front, back, tags=None):
+        """Build the AnkiConnect representation of a Basic note"""
         if tags is None:
             tags = []
         
-        note = {
+        return {
             "deckName": deck_name,
             "modelName": "Basic",
             "fields": {
@@ -85,9 +172,51 @@ class AnkiConnector:
             },
             "tags": tags
         }
-        
+    
+    def add_note(self, deck_name, front, back, tags=None):
+        """Add a new note to a deck"""
+        note = self.build_note(deck_name, front, back, tags)
         return self._invoke("addNote", note=note)
     
+    def add_notes(self, notes):
+        """Add several notes built with build_note, returns their ids (None where adding failed)"""
+        return self._invoke("addNotes", notes=notes)
+    
+    def try_add_notes(self, notes):
+        """
+        Add several notes, returning None in place of the id of each note Anki refuses.
+
+        Older AnkiConnect versions answer addNotes with None for refused notes;
+        newer ones fail the whole request, in which case the notes are added one
+        by one. Connection errors, including timeouts, are raised rather than
+        treated as refusals, since Anki may have added the notes anyway.
+        """
+        try:
+            return self.add_notes(notes)
+        except AnkiConnectionError:
+            raise
+        except Exception:
+            if len(notes) == 1:
+                return [None]
+        
+        note_ids = []
+        for note in notes:
+            try:
+                note_ids.append(self._invoke("addNote", note=note))
+            except AnkiConnectionError:
+                raise
+            except Exception:
+                note_ids.append(None)
+        return note_ids
+    
+    def can_add_notes(self, notes):
+        """Check which notes can be added, e.g. are not duplicates"""
+        return self._invoke("canAddNotes", notes=notes)
+    
+    def create_deck(self, deck_name):
+        """Create a deck if it does not exist yet, returns its id"""
+        return self._invoke("createDeck", deck=deck_name)
+    
     def update_note_fields(self, note_id, fields):
         """Update fields of an existing note"""
         note = {
@@ -96,16 +225,86 @@ class AnkiConnector:
         }
         return self._invoke("updateNoteFields", note=note)
     
+    def store_media_file(self, filename, file_path, chunk_size=MEDIA_CHUNK_SIZE):
+        """
+        Store a file in Anki's media folder, returns the stored file name.
+
+        The file is read and base64 encoded chunk by chunk while the request is
+        sent, so it is never held in memory as a whole. chunk_size is rounded
+        down to whole 3-byte groups, which keep the chunks free of base64 padding.
+        """
+        if chunk_size < 3:
+            raise ValueError(f"chunk_size must be at least 3, got {chunk_size}")
+        read_size = chunk_size - chunk_size % 3
+        size = os.path.getsize(file_path)
+        prefix = json.dumps({
+            "action": "storeMediaFile",
+            "version": self.version,
+            "params": {"filename": filename}
+        })[:-2].encode('utf-8') + b', "data": "'
+        suffix = b'"}}'
+        encoded_size = 4 * ((size + 2) // 3)
+        
+        def body():
+            yield prefix
+            with open(file_path, 'rb') as f:
+                chunk = f.read(read_size)
+                while chunk:
+                    yield base64.b64encode(chunk)
+                    chunk = f.read(read_size)
+            yield suffix
+        
+        request = urllib.request.Request(
+            self.url,
+            body(),
+            headers={"Content-Length": str(len(prefix) + encoded_size + len(suffix))}
+        )
+        return self._send(request)
+    
     def sync(self):
         """Trigger Anki sync with AnkiWeb"""
         return self._invoke("sync")
     
-    def get_reviews_of_cards(self, deck_name, start_date):
-        """Get review history for cards in a deck"""
+    def get_reviews_of_cards(self, deck_name, start_date=None):
+        """
+        Get review history for cards in a deck.
+
+        start_date may be a datetime, a date or a review id (milliseconds since
+        the epoch); only reviews at or after it are returned.
+        """
         # Note: This requires finding cards first
         card_ids = self._invoke("findCards", query=f"deck:{deck_name}")
-        return self._invoke("getReviewsOfCards", cards=card_ids)
+        reviews = self._invoke("getReviewsOfCards", cards=card_ids)
+        if start_date is None:
+            return reviews
+
+        start_id = _to_review_id(start_date)
+        return {
+            card_id: [review for review in card_reviews if review["id"] >= start_id]
+            for card_id, card_reviews in reviews.items()
+        }
+
+    def get_latest_review_id(self, deck_name):
+        """Get the id (epoch milliseconds) of the latest review in a deck, 0 if none"""
+        return self._invoke("getLatestReviewID", deck=deck_name)
+
+    def get_card_reviews(self, deck_name, start_id=0):
+        """
+        Get all reviews in a deck with an id greater than start_id.
+
+        Each review is a list of [reviewTime, cardID, usn, buttonPressed,
+        newInterval, previousInterval, newFactor, reviewDuration, reviewType].
+        """
+        return self._invoke("cardReviews", deck=deck_name, startID=start_id)
+
 
+def _to_review_id(value):
+    """Convert a datetime, date or epoch milliseconds to a review id"""
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp() * 1000)
+    if isinstance(value, datetime.date):
+        return int(datetime.datetime.combine(value, datetime.time()).timestamp() * 1000)
+    return int(value)
 
 def demo_sync():
     """Demonstrate basic Anki sync functionality"""
@@ -133,18 +332,19 @@ def demo_sync():
             print(f"  - {deck}")
         print()
         
-        # Get stats for each deck
+        # Get stats for all decks in one request
         if decks:
             print("Deck Statistics:")
-            for deck in decks[:3]:  # Show first 3 decks
-                try:
-                    stats = anki.get_deck_stats(deck)
+            try:
+                snapshot = anki.get_deck_stats_snapshot(decks)
+                for deck in decks[:3]:  # Show first 3 decks
+                    stats = snapshot.get_by_name(deck) or {}
                     print(f"\n  {deck}:")
                     print(f"    New cards: {stats.get('new_count', 0)}")
                     print(f"    Learning: {stats.get('learn_count', 0)}")
                     print(f"    Review: {stats.get('review_count', 0)}")
-                except Exception as e:
-                    print(f"    (Could not get stats: {e})")
+            except Exception as e:
+                print(f"    (Could not get stats: {e})")
         
         # Example: Find recent notes
         print("\n" + "="*40)
@@ -0,0 +1,136 @@
+"""
+Duplicate Card Index for AnkiSync
+Finds flashcards that Anki would reject as duplicates before anything is sent to it.
+"""
+
+import hashlib
+import html
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from obsidian_parser import Flashcard
+
+
+# Kinds of duplicates
+EXACT = "exact"  # Same front
+NEAR = "near"    # Same front once whitespace, case and HTML are ignored
+
+_html_tag_pattern = re.compile(r'<[^>]*>')
+_whitespace_pattern = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize flashcard text for duplicate detection.
+
+    Drops HTML tags, decodes entities, ignores case and collapses whitespace.
+    """
+    text = html.unescape(_html_tag_pattern.sub(' ', text))
+    return _whitespace_pattern.sub(' ', text).strip().casefold()
+
+
+@dataclass
+class DuplicateGroup:
+    """Flashcards sharing a normalized front, the first one is kept"""
+    key: str
+    cards: List[Flashcard] = field(default_factory=list)
+
+    @property
+    def kept(self) -> Flashcard:
+        return self.cards[0]
+
+    @property
+    def duplicates(self) -> List[Flashcard]:
+        return self.cards[1:]
+
+    def kind_of(self, card: Flashcard) -> str:
+        """Get whether the front of a duplicate matches the kept card exactly or only after normalization"""
+        return EXACT if card.front == self.kept.front else NEAR
+
+    def same_back(self, card: Flashcard) -> bool:
+        """Check whether a duplicate has the same back as the kept card"""
+        return card.back == self.kept.back
+
+
+@dataclass
+class DuplicateReport:
+    """Collisions found in a set of flashcards"""
+    groups: List[DuplicateGroup]
+
+    @property
+    def duplicate_count(self) -> int:
+        return sum(len(group.duplicates) for group in self.groups)
+
+    def format(self) -> str:
+        """Render the collisions, one kept card and its duplicates per block"""
+        lines = []
+        for group in self.groups:
+            kept = group.kept
+            front = ' '.join(kept.front.split())
+            lines.append(f"{kept.file_path}:{kept.line_number}: {front[:60]}")
+            for card in group.duplicates:
+                back = '' if group.same_back(card) else ', different back'
+                lines.append(f"  {group.kind_of(card)}: {card.file_path}:{card.line_number} ({card.type.value}{back})")
+        return '\n'.join(lines)
+
+
+class DuplicateIndex:
+    """
+    Index of flashcards by a hash of their normalized front.
+
+    Anki's duplicate check compares the first field of notes of the same note
+    type, so two cards with the same front are duplicates even if their backs
+    differ. This includes the reverse cards of bidirectional flashcards. The
+    first card added with a given front is kept; later ones are reported as
+    exact or near duplicates of it.
+    """
+
+    def __init__(self):
+        self._groups: Dict[str, DuplicateGroup] = {}
+
+    def add(self, flashcard: Flashcard) -> Optional[Flashcard]:
+        """
+        Add a flashcard to the index.
+
+        Args:
+            flashcard: Parsed flashcard
+
+        Returns:
+            The earlier flashcard it duplicates, or None if it is the first with its front
+        """
+        key = hashlib.blake2b(normalize_text(flashcard.front).encode('utf-8'), digest_size=16).hexdigest()
+        group = self._groups.get(key)
+        if group is None:
+            self._groups[key] = DuplicateGroup(key, [flashcard])
+            return None
+
+        group.cards.append(flashcard)
+        return group.kept
+
+    def filter(self, flashcards: Iterable[Flashcard]) -> List[Flashcard]:
+        """Add flashcards to the index, returning those that are not duplicates"""
+        return [flashcard for flashcard in flashcards if self.add(flashcard) is None]
+
+    def report(self) -> DuplicateReport:
+        """Get the collisions found so far"""
+        return DuplicateReport([group for group in self._groups.values() if len(group.cards) > 1])
+
+
+def demo_duplicate_index(vault_root: str = '.'):
+    """Report the duplicate flashcards of a vault"""
+    from vault_reader import VaultReader
+
+    index = DuplicateIndex()
+    for _, flashcards in VaultReader(vault_root).iter_flashcards():
+        index.filter(flashcards)
+
+    report = index.report()
+    print(f"Found {report.duplicate_count} duplicate flashcards")
+    if report.groups:
+        print(report.format())
+
+
+if __name__ == "__main__":
+    import sys
+    demo_duplicate_index(sys.argv[1] if len(sys.argv) > 1 else '.')
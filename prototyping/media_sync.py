@@ -0,0 +1,192 @@
+"""
+Media Sync for AnkiSync
+Uploads the images embedded in flashcards to Anki, each unique file exactly once.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from anki_sync import AnkiConnector
+from obsidian_parser import Flashcard, ObsidianFlashcardParser
+
+
+class MediaUploader:
+    """
+    Uploader for the media files referenced by flashcards.
+
+    A JSON manifest maps content hashes to the file names stored in Anki, so a
+    file is uploaded once no matter how many notes, paths or syncs reference it.
+    Stored names contain the hash, so different files with the same name do not
+    overwrite each other. The manifest also caches each path's hash by size and
+    modification time, so unchanged files are not read again on later syncs.
+    """
+
+    def __init__(self, anki: AnkiConnector, vault_root: str, manifest_path: str,
+                 parser: Optional[ObsidianFlashcardParser] = None):
+        """
+        Initialize the media uploader.
+
+        Args:
+            anki: Connector of the target Anki instance
+            vault_root: Root folder of the vault, used to resolve ![[name]] references
+            manifest_path: Path to the JSON manifest, one per Anki instance
+            parser: Parser used to rewrite media references in flashcard fields
+        """
+        self.anki = anki
+        self.vault_root = vault_root
+        self.manifest_path = manifest_path
+        self.parser = parser or ObsidianFlashcardParser()
+
+        self.uploaded = 0
+        self.reused = 0
+
+        self._manifest = self._load_manifest()
+        self._files_by_name: Optional[Dict[str, str]] = None
+
+    def prepare_fields(self, flashcard: Flashcard) -> Tuple[str, str]:
+        """
+        Upload the media of a flashcard and point its fields at the uploaded files.
+
+        Args:
+            flashcard: Parsed flashcard
+
+        Returns:
+            (front, back) with resolved media references replaced by Anki media tags
+        """
+        if not flashcard.media:
+            return flashcard.front, flashcard.back
+
+        stored_names = self.upload_card_media(flashcard)
+        return (
+            self.parser.replace_media_references(flashcard.front, stored_names),
+            self.parser.replace_media_references(flashcard.back, stored_names)
+        )
+
+    def upload_card_media(self, flashcard: Flashcard) -> Dict[str, str]:
+        """
+        Upload the media referenced by a flashcard.
+
+        Args:
+            flashcard: Parsed flashcard
+
+        Returns:
+            Reference -> stored file name, for the references that could be resolved
+        """
+        stored_names = {}
+        for reference in flashcard.media:
+            path = self.resolve(reference, flashcard.file_path)
+            if path is not None:
+                stored_names[reference] = self.upload(path)
+        return stored_names
+
+    def upload(self, path: str) -> str:
+        """
+        Upload a file unless a file with the same content was uploaded before.
+
+        Args:
+            path: Path to the media file
+
+        Returns:
+            File name of the media in Anki
+        """
+        digest = self._hash_file(path)
+        stored_name = self._manifest['stored'].get(digest)
+        if stored_name is not None:
+            self.reused += 1
+            return stored_name
+
+        stem, extension = os.path.splitext(os.path.basename(path))
+        stored_name = self.anki.store_media_file(f"{stem}-{digest[:16]}{extension}", path)
+        self._manifest['stored'][digest] = stored_name
+        self.uploaded += 1
+        return stored_name
+
+    def resolve(self, reference: str, note_path: str) -> Optional[str]:
+        """
+        Find the file a media reference points at.
+
+        Paths are tried relative to the note and to the vault root; a bare file
+        name, as in ![[image.png]], is looked up anywhere in the vault.
+
+        Args:
+            reference: Reference as returned by extract_media_references
+            note_path: Path to the note containing the reference
+
+        Returns:
+            Path to the file, or None if it does not exist
+        """
+        reference = reference.replace('%20', ' ')
+        for base in (os.path.dirname(note_path), self.vault_root):
+            candidate = os.path.normpath(os.path.join(base, reference))
+            if os.path.isfile(candidate):
+                return candidate
+
+        if self._files_by_name is None:
+            self._files_by_name = self._index_vault_files()
+        return self._files_by_name.get(os.path.basename(reference))
+
+    def save(self) -> None:
+        """Write the manifest to disk"""
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def _hash_file(self, path: str) -> str:
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        cached = self._manifest['files'].get(key)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        hexdigest = digest.hexdigest()
+        self._manifest['files'][key] = [stat.st_size, stat.st_mtime_ns, hexdigest]
+        return hexdigest
+
+    def _index_vault_files(self) -> Dict[str, str]:
+        """Map the file names in the vault to their paths, first one wins"""
+        files = {}
+        for dir_path, dir_names, file_names in os.walk(self.vault_root):
+            dir_names[:] = sorted(name for name in dir_names if not name.startswith('.'))
+            for file_name in sorted(file_names):
+                files.setdefault(file_name, os.path.join(dir_path, file_name))
+        return files
+
+    def _load_manifest(self) -> Dict:
+        if not os.path.exists(self.manifest_path):
+            return {'stored': {}, 'files': {}}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+def demo_media_upload(vault_root: str = '.'):
+    """Upload the media of every flashcard in a vault"""
+    from vault_reader import VaultReader
+
+    anki = AnkiConnector()
+    if not anki.check_connection():
+        return
+
+    uploader = MediaUploader(anki, vault_root, os.path.join(vault_root, '.ankisync_media.json'))
+    missing: List[str] = []
+    for _, flashcards in VaultReader(vault_root).iter_flashcards():
+        for flashcard in flashcards:
+            stored_names = uploader.upload_card_media(flashcard)
+            missing.extend(reference for reference in flashcard.media if reference not in stored_names)
+    uploader.save()
+
+    print(f"Uploaded: {uploader.uploaded}, already in Anki: {uploader.reused}")
+    if missing:
+        print(f"Not found: {', '.join(sorted(set(missing)))}")
+
+
+if __name__ == "__main__":
+    import sys
+    demo_media_upload(sys.argv[1] if len(sys.argv) > 1 else '.')
@@ -0,0 +1,201 @@
+"""
+Multi-Instance Sync for AnkiSync
+Parses a vault once and pushes it to several Anki instances concurrently.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from anki_sync import AnkiConnector
+from deck_inference import DeckInferenceEngine
+from duplicate_index import DuplicateIndex, DuplicateReport
+from media_sync import MediaUploader
+from obsidian_parser import ObsidianFlashcardParser
+from sync_pipeline import FileBatch, PipelineResult, SyncPipeline
+from vault_reader import VaultFile
+
+
+@dataclass
+class SyncTarget:
+    """An Anki instance and the deck inference configuration used for it"""
+    name: str
+    url: str
+    deck_config: Dict = field(default_factory=dict)
+    media_manifest: Optional[str] = None  # Manifest of the media uploaded to this instance
+
+
+@dataclass
+class TargetResult:
+    """Outcome of the sync to a single target"""
+    target: SyncTarget
+    result: Optional[PipelineResult] = None  # Partial if error is set, e.g. notes added before the failure
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class FanOutCoordinator:
+    """
+    Coordinator syncing one vault to several Anki instances.
+
+    The vault is parsed once and the resulting flashcards are shared, read-only,
+    by all targets. With skip_duplicates, cards with the same normalized front
+    as an earlier card are dropped once, before any target is contacted. Each
+    target then runs its own SyncPipeline concurrently, with its own
+    AnkiConnector and DeckInferenceEngine, so a target that is down or fails
+    halfway does not affect the others. cancel() stops parsing as well as the
+    pipelines, including those that have not started yet.
+    """
+
+    def __init__(self, targets: List[SyncTarget], parser: Optional[ObsidianFlashcardParser] = None,
+                 queue_size: int = 8, push_batch_size: int = 100, skip_duplicates: bool = False,
+                 vault_root: Optional[str] = None):
+        """
+        Initialize the coordinator.
+
+        Args:
+            targets: Anki instances to sync to
+            parser: Parser used to parse the vault once for all targets
+            queue_size: Queue size of each target's pipeline
+            push_batch_size: Maximum number of notes per addNotes request
+            skip_duplicates: Drop duplicate cards of the vault while parsing
+            vault_root: Root folder of the vault; media is uploaded to targets that have a media_manifest
+        """
+        self.targets = targets
+        self.parser = parser or ObsidianFlashcardParser()
+        self.queue_size = queue_size
+        self.push_batch_size = push_batch_size
+        self.skip_duplicates = skip_duplicates
+        self.vault_root = vault_root
+        self.duplicate_report: Optional[DuplicateReport] = None
+
+        self._pipelines: List[SyncPipeline] = []
+        self._cancelled = threading.Event()
+
+    def parse(self, files: Iterable[VaultFile]) -> List[FileBatch]:
+        """
+        Parse the given files once for all targets.
+
+        Args:
+            files: Files to sync, e.g. a VaultReader
+
+        Returns:
+            Parsed, tagged flashcards per file, only those parsed before a cancel()
+        """
+        duplicate_index = DuplicateIndex() if self.skip_duplicates else None
+
+        batches = []
+        for vault_file in files:
+            if self._cancelled.is_set():
+                break
+            cards = self.parser.parse_file(vault_file.path, vault_file.content)
+            self.parser.extract_tags_and_deck_for_file(cards, vault_file.content)
+            if duplicate_index is not None:
+                cards = duplicate_index.filter(cards)
+            batches.append(FileBatch(vault_file.path, cards))
+
+        if duplicate_index is not None:
+            self.duplicate_report = duplicate_index.report()
+        return batches
+
+    def run(self, files: Iterable[VaultFile]) -> Dict[str, TargetResult]:
+        """
+        Parse the files and push them to all targets.
+
+        Args:
+            files: Files to sync, e.g. a VaultReader
+
+        Returns:
+            Result per target name
+        """
+        return self.push(self.parse(files))
+
+    def push(self, batches: List[FileBatch]) -> Dict[str, TargetResult]:
+        """
+        Push already parsed flashcards to all targets concurrently.
+
+        Args:
+            batches: Parsed flashcards per file, e.g. from parse()
+
+        Returns:
+            Result per target name
+        """
+        self._pipelines = [self._create_pipeline(target) for target in self.targets]
+        # After the pipelines are published, so a concurrent cancel() reaches them either here or directly
+        if self._cancelled.is_set():
+            for pipeline in self._pipelines:
+                pipeline.cancel()
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, len(self.targets)), thread_name_prefix='sync-target') as executor:
+                futures = [
+                    executor.submit(pipeline.run_parsed, batches)
+                    for pipeline in self._pipelines
+                ]
+
+                results = {}
+                for target, pipeline, future in zip(self.targets, self._pipelines, futures):
+                    try:
+                        results[target.name] = TargetResult(target, result=future.result())
+                    except Exception as e:
+                        results[target.name] = TargetResult(target, result=pipeline.result, error=e)
+        finally:
+            # Reset when the push ends, so a cancel() during parse() still stops it
+            self._cancelled.clear()
+
+        return results
+
+    def _create_pipeline(self, target: SyncTarget) -> SyncPipeline:
+        anki = AnkiConnector(target.url)
+        media_uploader = None
+        if self.vault_root is not None and target.media_manifest is not None:
+            media_uploader = MediaUploader(anki, self.vault_root, target.media_manifest, parser=self.parser)
+
+        return SyncPipeline(
+            anki,
+            DeckInferenceEngine(target.deck_config),
+            parser=self.parser,
+            queue_size=self.queue_size,
+            push_batch_size=self.push_batch_size,
+            media_uploader=media_uploader
+        )
+
+    def cancel(self) -> None:
+        """Stop parsing and the pipelines of all targets"""
+        self._cancelled.set()
+        for pipeline in self._pipelines:
+            pipeline.cancel()
+
+
+def demo_multi_sync(vault_root: str = '.'):
+    """Push a vault to two local Anki instances with different deck configurations"""
+    from deck_inference import create_example_config
+    from vault_reader import VaultReader
+
+    targets = [
+        SyncTarget('team-a', 'http://localhost:8765', create_example_config(),
+                   os.path.join(vault_root, '.ankisync_media_team_a.json')),
+        SyncTarget('team-b', 'http://localhost:8766', {'default_deck': 'Team B'},
+                   os.path.join(vault_root, '.ankisync_media_team_b.json')),
+    ]
+
+    coordinator = FanOutCoordinator(targets, skip_duplicates=True, vault_root=vault_root)
+    results = coordinator.run(VaultReader(vault_root))
+    print(f"Skipped {coordinator.duplicate_report.duplicate_count} duplicate flashcards")
+    for name, target_result in results.items():
+        if target_result.ok:
+            result = target_result.result
+            print(f"{name}: added {result.added}, skipped {result.skipped}, failed {result.failed}")
+        else:
+            result = target_result.result
+            print(f"{name}: failed after adding {result.added} ({target_result.error})")
+
+
+if __name__ == "__main__":
+    import sys
+    demo_multi_sync(sys.argv[1] if len(sys.argv) > 1 else '.')
@@ -3,12 +3,21 @@ Obsidian Spaced Repetition Flashcard Parser
 Parses various flashcard formats used by the Obsidian Spaced Repetition plugin.
 """
 
+import bisect
+import hashlib
+import html
+import os
 import re
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
 from enum import Enum
 
 
+# File extensions of embeds that are media rather than note transclusions
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.svg', '.webp', '.avif', '.tif', '.tiff', '.ico'}
+SOUND_EXTENSIONS = {'.mp3', '.wav', '.ogg', '.m4a', '.flac', '.webm', '.mp4', '.ogv', '.3gp', '.mov', '.mkv'}
+
+
 class FlashcardType(Enum):
     SINGLE_LINE_BASIC = "single_line_basic"      # question::answer
     SINGLE_LINE_BIDIRECTIONAL = "single_line_bidirectional"  # question:::answer
@@ -28,10 +37,86 @@ class Flashcard:
     raw_text: str
     tags: List[str] = None
     deck: str = None
+    media: List[str] = None  # Referenced media files, as written in the note
 
     def __post_init__(self):
         if self.tags is None:
             self.tags = []
+        if self.media is None:
+            self.media = []
+
+
+@dataclass
+class SourceSpan:
+    """A range in a source file, with 1-based lines and 0-based columns"""
+    start_line: int
+    start_column: int
+    end_line: int
+    end_column: int
+
+
+class LineOffsetTable:
+    """
+    Newline offset table for a single file's content.
+
+    Built once per file in a single pass, then maps between character offsets
+    and (line, column) positions with a binary search. Lines are 1-based to match
+    Flashcard.line_number; columns are 0-based character offsets into the line.
+    Offsets are str indices, as used by re match positions. The table does not
+    keep the content; callers build one per file and drop it with the file.
+    """
+
+    def __init__(self, content: str):
+        self.length = len(content)
+
+        # line_starts[i] is the offset of the first character of line i + 1
+        self.line_starts = [0]
+        find = content.find
+        position = find('\n')
+        while position != -1:
+            self.line_starts.append(position + 1)
+            position = find('\n', position + 1)
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines in the content"""
+        return len(self.line_starts)
+
+    def line_of(self, offset: int) -> int:
+        """Get the 1-based line number containing the given offset"""
+        self._check_offset(offset)
+        return bisect.bisect_right(self.line_starts, offset)
+
+    def position_of(self, offset: int) -> Tuple[int, int]:
+        """Get the (line, column) position of the given offset"""
+        line = self.line_of(offset)
+        return line, offset - self.line_starts[line - 1]
+
+    def offset_of(self, line: int, column: int = 0) -> int:
+        """Get the offset of the given (line, column) position"""
+        if line < 1 or line > self.line_count:
+            raise ValueError(f"Line {line} is outside of 1..{self.line_count}")
+        start, end = self.line_range(line)
+        if column < 0 or start + column > end:
+            raise ValueError(f"Column {column} is outside of line {line}")
+        return start + column
+
+    def line_range(self, line: int) -> Tuple[int, int]:
+        """Get the (start, end) offsets of a line, excluding its newline"""
+        start = self.line_starts[line - 1]
+        if line < self.line_count:
+            return start, self.line_starts[line] - 1
+        return start, self.length
+
+    def span_of(self, start: int, end: int) -> SourceSpan:
+        """Get the source span covering the offsets [start, end)"""
+        start_line, start_column = self.position_of(start)
+        end_line, end_column = self.position_of(end)
+        return SourceSpan(start_line, start_column, end_line, end_column)
+
+    def _check_offset(self, offset: int) -> None:
+        if offset < 0 or offset > self.length:
+            raise ValueError(f"Offset {offset} is outside of 0..{self.length}")
 
 
 class ObsidianFlashcardParser:
@@ -84,6 +169,15 @@ class ObsidianFlashcardParser:
             re.MULTILINE | re.DOTALL
         )
 
+        # Embedded media: ![[image.png]], ![[image.png|200]] and ![alt](path/image.png "title")
+        self.media_pattern = re.compile(
+            r'!\[\[([^\]|#\n]+)(?:[|#][^\]\n]*)?\]\]'
+            r'|!\[[^\]\n]*\]\(\s*<?([^)>\s]+)>?(?:\s+"[^"\n]*")?\s*\)'
+        )
+
+        # Tags on a single line, used for local tag and deck extraction
+        self.line_tag_pattern = re.compile(r'#(\w+)')
+
         # Cloze deletions: ==text==
         self.cloze_pattern = re.compile(
             rf'{re.escape(self.cloze_delimiter)}(.*?){re.escape(self.cloze_delimiter)}'
@@ -116,6 +210,61 @@ class ObsidianFlashcardParser:
 
         return list(set(tags))  # Remove duplicates
 
+    def extract_media_references(self, text: str) -> List[str]:
+        """
+        Extract the local media files embedded in text.
+
+        Args:
+            text: Flashcard or note text
+
+        Returns:
+            Referenced file names or paths in order of appearance, without duplicates
+        """
+        if '![' not in text:
+            return []
+
+        references = []
+        for match in self.media_pattern.finditer(text):
+            reference = self._media_reference(match)
+            if reference is not None and reference not in references:
+                references.append(reference)
+        return references
+
+    def _media_reference(self, match: re.Match) -> Optional[str]:
+        """Get the local media file of an embed, None for note transclusions and remote media"""
+        reference = (match.group(1) or match.group(2)).strip()
+        if '://' in reference or reference.startswith('data:'):
+            return None  # Remote or inline media is left to Anki
+        extension = os.path.splitext(reference)[1].lower()
+        if extension not in IMAGE_EXTENSIONS and extension not in SOUND_EXTENSIONS:
+            return None  # ![[Other Note]] embeds a note, not a file
+        return reference
+
+    def replace_media_references(self, text: str, stored_names: Dict[str, str]) -> str:
+        """
+        Replace embedded media with references to Anki media files: HTML image
+        tags for images and [sound:...] tags for audio and video.
+
+        Args:
+            text: Flashcard text
+            stored_names: Reference (as returned by extract_media_references) -> Anki media file name
+
+        Returns:
+            Text with the known references replaced
+        """
+        def replace(match):
+            reference = self._media_reference(match)
+            stored_name = stored_names.get(reference) if reference is not None else None
+            if stored_name is None:
+                return match.group(0)
+            if os.path.splitext(stored_name)[1].lower() in SOUND_EXTENSIONS:
+                return f'[sound:{stored_name}]'
+            return f'<img src="{html.escape(stored_name)}">'
+
+        if '![' not in text:
+            return text
+        return self.media_pattern.sub(replace, text)
+
     def parse_file(self, file_path: str, content: str) -> List[Flashcard]:
         """
         Parse a file for flashcards using a line-by-line approach.
@@ -127,12 +276,23 @@ class ObsidianFlashcardParser:
         Returns:
             List of parsed flashcards
         """
-        flashcards = []
         lines = content.split('\n')
 
         # Extract tags from the entire file content
         file_tags = self._extract_file_tags(content)
 
+        line_cards, cloze_cards = self._parse_lines(file_path, content, lines)
+        return self._build_flashcards(file_path, line_cards, cloze_cards, file_tags)
+
+    def _parse_lines(self, file_path: str, content: str, lines: List[str]) -> Tuple[List[Dict], List[Flashcard]]:
+        """
+        Find the flashcards in the given lines.
+
+        Returns:
+            Tuple of (single-line and multi-line card dicts, cloze flashcards), without tags
+        """
+        flashcards = []
+
         i = 0
         while i < len(lines):
             line = lines[i].strip()
@@ -153,8 +313,6 @@ class ObsidianFlashcardParser:
                 card = self._parse_multi_line_at_line(lines, i, is_bidirectional=False)
 
             if card:
-                # Add file-level tags to the flashcard
-                card['tags'] = file_tags.copy()
                 flashcards.append(card)
                 # Skip lines that were consumed by this flashcard
                 i += card.get('lines_consumed', 1)
@@ -163,40 +321,46 @@ class ObsidianFlashcardParser:
 
         # Parse cloze cards separately (they can be anywhere)
         cloze_cards = self._parse_cloze_cards_simple(file_path, content, lines)
-        for cloze_card in cloze_cards:
-            # Add file-level tags to cloze cards too
-            cloze_card.tags.extend(file_tags)
-            flashcards.append(cloze_card)
 
-        # Convert dicts to Flashcard objects
-        result = []
-        for card_data in flashcards:
-            if isinstance(card_data, dict):
-                card_type = card_data['type']
+        return flashcards, cloze_cards
 
-                # Create the primary card
+    def _build_flashcards(self, file_path: str, line_cards: List[Dict], cloze_cards: List[Flashcard],
+                          file_tags: List[str]) -> List[Flashcard]:
+        """Convert parsed card dicts to Flashcard objects, followed by the cloze cards"""
+        result = []
+        for card_data in line_cards:
+            card_type = card_data['type']
+
+            media = self.extract_media_references(f"{card_data['front']}\n{card_data['back']}")
+
+            # Create the primary card
+            result.append(Flashcard(
+                type=card_type,
+                front=card_data['front'],
+                back=card_data['back'],
+                file_path=file_path,
+                line_number=card_data['line_number'],
+                raw_text=f"{card_data['front']} :: {card_data['back']}",
+                media=media
+            ))
+
+            # Add reverse direction for bidirectional cards
+            if 'bidirectional' in str(card_type.value):
                 result.append(Flashcard(
                     type=card_type,
-                    front=card_data['front'],
-                    back=card_data['back'],
+                    front=card_data['back'],
+                    back=card_data['front'],
                     file_path=file_path,
                     line_number=card_data['line_number'],
-                    raw_text=f"{card_data['front']} :: {card_data['back']}"
+                    raw_text=f"{card_data['back']} :: {card_data['front']}",
+                    media=list(media)
                 ))
 
-                # Add reverse direction for bidirectional cards
-                if 'bidirectional' in str(card_type.value):
-                    result.append(Flashcard(
-                        type=card_type,
-                        front=card_data['back'],
-                        back=card_data['front'],
-                        file_path=file_path,
-                        line_number=card_data['line_number'],
-                        raw_text=f"{card_data['back']} :: {card_data['front']}"
-                    ))
-            else:
-                # Already a Flashcard object
-                result.append(card_data)
+        for cloze_card in cloze_cards:
+            # Add file-level tags to cloze cards too
+            cloze_card.tags.extend(file_tags)
+            cloze_card.media = self.extract_media_references(cloze_card.back)
+            result.append(cloze_card)
 
         return result
 
@@ -306,36 +470,94 @@ class ObsidianFlashcardParser:
         """Legacy method - replaced by simplified cloze parsing"""
         return []
 
-    def _get_line_number(self, content: str, position: int) -> int:
-        """Get the line number for a given position in content"""
-        return content[:position].count('\n') + 1
+    def _get_line_number(self, content: str, position: int,
+                         offsets: Optional[LineOffsetTable] = None) -> int:
+        """
+        Get the line number for a given position in content.
+
+        Args:
+            content: File content as string
+            position: Character offset in content
+            offsets: Offset table of content, for callers resolving many positions of the same file
+
+        Returns:
+            1-based line number
+        """
+        if offsets is not None:
+            return offsets.line_of(position)
+        return content.count('\n', 0, position) + 1
+
+    def _build_line_tag_index(self, file_content: str) -> List[List[str]]:
+        """
+        Build a per-line index of the #tags found in the file content.
+
+        Args:
+            file_content: File content as string
 
-    def extract_tags_and_deck(self, flashcard: Flashcard, file_content: str) -> None:
+        Returns:
+            List indexed by 0-based line number, holding the tags on that line
+        """
+        findall = self.line_tag_pattern.findall
+        return [findall(line) for line in file_content.split('\n')]
+
+    def extract_tags_and_deck(self, flashcard: Flashcard, file_content: str,
+                              line_tags: Optional[List[List[str]]] = None) -> None:
         """
         Extract tags and deck information from the file content.
         This is a simplified implementation - in practice, you'd need more sophisticated parsing.
+
+        Args:
+            flashcard: Flashcard to update in place
+            file_content: Content of the file the flashcard came from
+            line_tags: Optional index from _build_line_tag_index, reused across cards of the same file
         """
-        # Look for #flashcard tags near the flashcard
-        lines = file_content.split('\n')
-        start_line = max(0, flashcard.line_number - 5)  # Look a few lines before
-        end_line = min(len(lines), flashcard.line_number + 5)  # Look a few lines after
+        if line_tags is None:
+            line_tags = self._build_line_tag_index(file_content)
+        self._assign_tags_and_deck(flashcard, line_tags, self._deck_from_path(flashcard.file_path))
 
-        for line_num in range(start_line, end_line):
-            line = lines[line_num].strip()
+    def extract_tags_and_deck_for_file(self, flashcards: List[Flashcard], file_content: str) -> None:
+        """
+        Extract tags and deck information for all flashcards of a single file.
 
-            # Extract tags (simplified - just #tag format)
-            tag_matches = re.findall(r'#(\w+)', line)
+        The file content is split and scanned for tags once, instead of once per flashcard.
+
+        Args:
+            flashcards: Flashcards parsed from file_content, updated in place
+            file_content: Content of the file the flashcards came from
+        """
+        if not flashcards:
+            return
+
+        line_tags = self._build_line_tag_index(file_content)
+        decks_by_path = {}
+        for flashcard in flashcards:
+            if flashcard.file_path not in decks_by_path:
+                decks_by_path[flashcard.file_path] = self._deck_from_path(flashcard.file_path)
+            self._assign_tags_and_deck(flashcard, line_tags, decks_by_path[flashcard.file_path])
+
+    def _assign_tags_and_deck(self, flashcard: Flashcard, line_tags: List[List[str]],
+                              folder_deck: Optional[str]) -> None:
+        """Apply the tags found in a few lines around the flashcard"""
+        # Look a few lines before and after the flashcard
+        start_line = max(0, flashcard.line_number - 5)
+        end_line = min(len(line_tags), flashcard.line_number + 5)
+
+        for line_num in range(start_line, end_line):
+            tag_matches = line_tags[line_num]
             if tag_matches:
                 flashcard.tags.extend(tag_matches)
 
             # Extract deck from folder structure (simplified)
             # In practice, this would be based on file path
-            if 'flashcard' in tag_matches:
-                # Use parent folder as deck
-                import os
-                parent_dir = os.path.basename(os.path.dirname(flashcard.file_path))
-                if parent_dir and parent_dir != os.path.basename(flashcard.file_path):
-                    flashcard.deck = parent_dir
+            if folder_deck and 'flashcard' in tag_matches:
+                flashcard.deck = folder_deck
+
+    def _deck_from_path(self, file_path: str) -> Optional[str]:
+        """Use the parent folder of the file as deck name"""
+        parent_dir = os.path.basename(os.path.dirname(file_path))
+        if parent_dir and parent_dir != os.path.basename(file_path):
+            return parent_dir
+        return None
 
     def _parse_cloze_cards_simple(self, file_path: str, content: str, lines: List[str]) -> List[Flashcard]:
         """Parse cloze deletion flashcards using a simpler approach"""
@@ -402,6 +624,122 @@ class ObsidianFlashcardParser:
         return cards
 
 
+@dataclass
+class ParsedBlock:
+    """Flashcards of a blank-line-delimited block, with line numbers relative to the block"""
+    line_cards: List[Flashcard]
+    cloze_cards: List[Flashcard]
+
+
+class IncrementalFlashcardParser:
+    """
+    Parser that only reparses the changed parts of a file.
+
+    Files are split into blocks of non-blank lines. No flashcard spans a blank
+    line (multi-line answers end at one), so each block parses independently.
+    Parse results are kept per file by block hash; on the next parse of the file
+    only blocks with a new hash are parsed, and copies of the cached flashcards
+    are spliced back with their line numbers shifted to the block's current position.
+    File-level tags are extracted from the whole content, since whether a #tag
+    counts depends on the text before it, which may be in an earlier block.
+    """
+
+    def __init__(self, parser: Optional[ObsidianFlashcardParser] = None):
+        self.parser = parser or ObsidianFlashcardParser()
+        self._blocks: Dict[str, Dict[bytes, ParsedBlock]] = {}
+
+        self.blocks_parsed = 0
+        self.blocks_reused = 0
+
+    def parse_file(self, file_path: str, content: str) -> List[Flashcard]:
+        """
+        Parse a file for flashcards, reusing the results of unchanged blocks.
+
+        Args:
+            file_path: Path to the file being parsed
+            content: File content as string
+
+        Returns:
+            List of parsed flashcards, as returned by ObsidianFlashcardParser.parse_file
+        """
+        cached_blocks = self._blocks.get(file_path, {})
+        current_blocks = {}
+
+        line_cards = []
+        cloze_cards = []
+
+        for start_idx, block_lines in self._split_blocks(content):
+            block_text = '\n'.join(block_lines)
+            block_hash = hashlib.blake2b(block_text.encode('utf-8'), digest_size=16).digest()
+
+            block = current_blocks.get(block_hash) or cached_blocks.get(block_hash)
+            if block is None:
+                block = self._parse_block(file_path, block_text, block_lines)
+                self.blocks_parsed += 1
+            else:
+                self.blocks_reused += 1
+            current_blocks[block_hash] = block
+
+            # Copies keep the cached flashcards safe from callers that modify them
+            line_cards.extend(self._shift(card, start_idx) for card in block.line_cards)
+            cloze_cards.extend(self._shift(card, start_idx) for card in block.cloze_cards)
+
+        self._blocks[file_path] = current_blocks
+
+        file_tags = self.parser._extract_file_tags(content) if cloze_cards else []
+        for cloze_card in cloze_cards:
+            # Add file-level tags to cloze cards too
+            cloze_card.tags.extend(file_tags)
+
+        return line_cards + cloze_cards
+
+    def forget(self, file_path: str) -> None:
+        """Drop the cached blocks of a file, e.g. after it was deleted"""
+        self._blocks.pop(file_path, None)
+
+    def _parse_block(self, file_path: str, block_text: str, block_lines: List[str]) -> ParsedBlock:
+        line_cards, cloze_cards = self.parser._parse_lines(file_path, block_text, block_lines)
+        flashcards = self.parser._build_flashcards(file_path, line_cards, cloze_cards, [])
+        line_card_count = len(flashcards) - len(cloze_cards)
+        return ParsedBlock(
+            line_cards=flashcards[:line_card_count],
+            cloze_cards=flashcards[line_card_count:]
+        )
+
+    @staticmethod
+    def _shift(card: Flashcard, line_offset: int) -> Flashcard:
+        """Copy a cached flashcard, moved down by line_offset lines"""
+        return Flashcard(
+            type=card.type,
+            front=card.front,
+            back=card.back,
+            file_path=card.file_path,
+            line_number=card.line_number + line_offset,
+            raw_text=card.raw_text,
+            media=list(card.media)
+        )
+
+    def _split_blocks(self, content: str) -> List[Tuple[int, List[str]]]:
+        """Split content into (0-based start line, lines) blocks of non-blank lines"""
+        blocks = []
+        block_lines = []
+        start_idx = 0
+
+        for line_idx, line in enumerate(content.split('\n')):
+            if line.strip() == '':
+                if block_lines:
+                    blocks.append((start_idx, block_lines))
+                    block_lines = []
+                continue
+            if not block_lines:
+                start_idx = line_idx
+            block_lines.append(line)
+
+        if block_lines:
+            blocks.append((start_idx, block_lines))
+        return blocks
+
+
 # Example usage and testing
 def test_parser():
     """Test the flashcard parser with sample content"""
@@ -0,0 +1,259 @@
+"""
+Incremental Review Log Export
+Pulls new Anki reviews per deck and appends them to a compact columnar store.
+"""
+
+import array
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy
+except ImportError:  # Optional: only used to speed up statistics
+    numpy = None
+
+from anki_sync import AnkiConnector
+
+
+@dataclass(frozen=True)
+class ReviewColumn:
+    """A column of the review log and the position of its value in a cardReviews entry"""
+    name: str
+    typecode: str  # array module typecode
+    source_index: Optional[int]  # None for columns not taken from the review entry
+
+
+# cardReviews entries are [reviewTime, cardID, usn, buttonPressed,
+# newInterval, previousInterval, newFactor, reviewDuration, reviewType]
+REVIEW_COLUMNS = [
+    ReviewColumn('review_id', 'q', 0),
+    ReviewColumn('card_id', 'q', 1),
+    ReviewColumn('ease', 'b', 3),
+    ReviewColumn('interval', 'i', 4),
+    ReviewColumn('last_interval', 'i', 5),
+    ReviewColumn('factor', 'i', 6),
+    ReviewColumn('duration', 'i', 7),
+    ReviewColumn('review_type', 'b', 8),
+    ReviewColumn('deck', 'i', None),
+]
+
+# reviewType value for reviews of graduated cards
+REVIEW_TYPE_REVIEW = 1
+
+
+class ReviewLogStore:
+    """
+    Append-only columnar store of review log entries.
+
+    Each column is a flat binary file of fixed-size values written with the array
+    module, so it can be loaded in one read (or with numpy.fromfile) and processed
+    in vectorized passes. A small metadata file holds the committed row count,
+    the deck name table and the per-deck cursors.
+    """
+
+    META_FILE = 'meta.json'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._meta = self._load_meta()
+
+    @property
+    def row_count(self) -> int:
+        return self._meta['rows']
+
+    def get_cursor(self, deck_name: str) -> int:
+        """Get the id of the last stored review of a deck, 0 if none"""
+        return self._meta['cursors'].get(deck_name, 0)
+
+    def append(self, deck_name: str, reviews: Sequence[Sequence[int]]) -> None:
+        """
+        Append cardReviews entries of a deck and advance its cursor.
+
+        The metadata is written last, so rows of an interrupted append are
+        ignored and overwritten by the next one.
+
+        Args:
+            deck_name: Deck the reviews belong to
+            reviews: cardReviews entries, in ascending review id order
+        """
+        if not reviews:
+            return
+
+        deck_index = self._deck_index(deck_name)
+        rows = self.row_count
+
+        for column in REVIEW_COLUMNS:
+            if column.source_index is None:
+                values = array.array(column.typecode, [deck_index]) * len(reviews)
+            else:
+                values = array.array(column.typecode, (review[column.source_index] for review in reviews))
+
+            with open(self._column_path(column), 'ab') as f:
+                # Drop rows past the committed count left by an interrupted append
+                f.truncate(rows * values.itemsize)
+                values.tofile(f)
+
+        self._meta['rows'] = rows + len(reviews)
+        self._meta['cursors'][deck_name] = reviews[-1][0]
+        self._save_meta()
+
+    def load_column(self, name: str):
+        """
+        Load a column of all committed rows.
+
+        Returns:
+            numpy array if numpy is installed, array.array otherwise
+        """
+        column = self._get_column(name)
+        path = self._column_path(column)
+        rows = self.row_count
+
+        if numpy is not None:
+            if rows == 0:
+                return numpy.empty(0, dtype=column.typecode)
+            return numpy.fromfile(path, dtype=column.typecode, count=rows)
+
+        values = array.array(column.typecode)
+        if rows:
+            with open(path, 'rb') as f:
+                values.fromfile(f, rows)
+        return values
+
+    def deck_names(self) -> List[str]:
+        """Get the deck names, indexed by the values of the deck column"""
+        return list(self._meta['decks'])
+
+    def retention(self, deck_name: Optional[str] = None) -> Optional[float]:
+        """
+        Get the share of reviews of graduated cards that were not answered "Again".
+
+        Args:
+            deck_name: Restrict to a single deck, or None for all decks
+
+        Returns:
+            Retention between 0 and 1, or None if there are no such reviews
+        """
+        deck_index = None
+        if deck_name is not None:
+            if deck_name not in self._meta['decks']:
+                return None
+            deck_index = self._meta['decks'].index(deck_name)
+
+        ease = self.load_column('ease')
+        review_type = self.load_column('review_type')
+        deck = self.load_column('deck') if deck_index is not None else None
+
+        if numpy is not None:
+            mask = review_type == REVIEW_TYPE_REVIEW
+            if deck is not None:
+                mask &= deck == deck_index
+            total = int(mask.sum())
+            passed = int((mask & (ease > 1)).sum())
+        else:
+            total = passed = 0
+            for i, kind in enumerate(review_type):
+                if kind != REVIEW_TYPE_REVIEW or (deck is not None and deck[i] != deck_index):
+                    continue
+                total += 1
+                if ease[i] > 1:
+                    passed += 1
+
+        return passed / total if total else None
+
+    def _deck_index(self, deck_name: str) -> int:
+        decks = self._meta['decks']
+        if deck_name not in decks:
+            decks.append(deck_name)
+        return decks.index(deck_name)
+
+    def _get_column(self, name: str) -> ReviewColumn:
+        for column in REVIEW_COLUMNS:
+            if column.name == name:
+                return column
+        raise KeyError(f"Unknown review log column '{name}'")
+
+    def _column_path(self, column: ReviewColumn) -> str:
+        return os.path.join(self.directory, f'{column.name}.bin')
+
+    def _load_meta(self) -> Dict:
+        path = os.path.join(self.directory, self.META_FILE)
+        if not os.path.exists(path):
+            return {'rows': 0, 'decks': [], 'cursors': {}}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_meta(self) -> None:
+        path = os.path.join(self.directory, self.META_FILE)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._meta, f)
+        os.replace(temp_path, path)
+
+
+class IncrementalReviewExporter:
+    """
+    Exports Anki review history into a ReviewLogStore.
+
+    Each run only requests reviews newer than the per-deck cursor kept by the
+    store, and appends them in chunks so an interrupted run keeps its progress.
+    """
+
+    def __init__(self, anki: AnkiConnector, store: ReviewLogStore, chunk_size: int = 50000):
+        self.anki = anki
+        self.store = store
+        self.chunk_size = chunk_size
+
+    def export_deck(self, deck_name: str) -> int:
+        """
+        Export the reviews of a deck that are newer than its cursor.
+
+        Returns:
+            Number of reviews appended
+        """
+        cursor = self.store.get_cursor(deck_name)
+        if self.anki.get_latest_review_id(deck_name) <= cursor:
+            return 0
+
+        reviews = self.anki.get_card_reviews(deck_name, cursor)
+        reviews.sort(key=lambda review: review[0])
+
+        for start in range(0, len(reviews), self.chunk_size):
+            self.store.append(deck_name, reviews[start:start + self.chunk_size])
+
+        return len(reviews)
+
+    def export_decks(self, deck_names: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        Export new reviews of several decks (all decks by default).
+
+        Returns:
+            Number of reviews appended per deck
+        """
+        if deck_names is None:
+            deck_names = self.anki.get_deck_names()
+        return {deck_name: self.export_deck(deck_name) for deck_name in deck_names}
+
+
+def demo_review_export():
+    """Demonstrate the incremental review export"""
+    anki = AnkiConnector()
+    if not anki.check_connection():
+        return
+
+    store = ReviewLogStore('review_log')
+    exporter = IncrementalReviewExporter(anki, store)
+
+    for deck_name, count in exporter.export_decks().items():
+        print(f"  {deck_name}: {count} new reviews")
+
+    print(f"\nStored reviews: {store.row_count}")
+    retention = store.retention()
+    if retention is not None:
+        print(f"Retention: {retention:.1%}")
+
+
+if __name__ == "__main__":
+    demo_review_export()
@@ -0,0 +1,296 @@
+"""
+Sync Journal for AnkiSync
+Stores sync plans on disk and checkpoints their execution, so an interrupted sync resumes
+where it stopped.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List
+
+from anki_sync import AnkiConnector
+
+
+# Actions a plan may contain; params are passed to AnkiConnect as they are stored
+CREATE_DECK = "createDeck"
+ADD_NOTE = "addNote"
+UPDATE_NOTE_FIELDS = "updateNoteFields"
+
+# Checkpoint status of addNote instructions that did not create a note
+STATUS_DUPLICATE = "duplicate"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class SyncInstruction:
+    """A single AnkiConnect request of a sync plan"""
+    seq: int
+    action: str
+    params: Dict
+
+
+@dataclass
+class SyncPlanResult:
+    """Outcome of executing a sync plan"""
+    applied: int = 0
+    already_done: int = 0  # Checkpointed by an earlier run
+    duplicates: int = 0
+    failed: int = 0
+
+
+def _dump(data: Dict) -> str:
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+
+def _escape_search(text: str) -> str:
+    """Escape text for use inside a quoted Anki search term"""
+    for char in ('\\', '"', '*', '_'):
+        text = text.replace(char, '\\' + char)
+    return text
+
+
+class SyncPlan:
+    """
+    Sync plan stored as a JSONL journal of instructions.
+
+    Executing the plan appends a checkpoint per applied instruction, with the
+    result Anki returned (the note id for addNote), to a second JSONL file next
+    to it. A later execute() skips checkpointed instructions. Consecutive addNote
+    instructions are sent as one addNotes request; when resuming, the first batch
+    that may have been in flight is checked with canAddNotes first, so notes that
+    reached Anki before the interruption are not added twice. Notes Anki refuses
+    as duplicates are looked up with findNotes, so their checkpoints still hold
+    the id of the note in Anki.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open an existing sync plan.
+
+        Args:
+            path: Path to the plan's JSONL file
+        """
+        self.path = path
+        self.checkpoint_path = os.path.splitext(path)[0] + '.checkpoints.jsonl'
+
+    @classmethod
+    def create(cls, path: str, instructions: Iterable[Dict]) -> 'SyncPlan':
+        """
+        Write a new sync plan, discarding the checkpoints of an older plan at the same path.
+
+        Args:
+            path: Path to the plan's JSONL file
+            instructions: Dicts with the "action" and "params" of each request
+
+        Returns:
+            The new plan
+        """
+        plan = cls(path)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for seq, instruction in enumerate(instructions):
+                f.write(_dump({'seq': seq, 'action': instruction['action'], 'params': instruction['params']}))
+                f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        if os.path.exists(plan.checkpoint_path):
+            os.remove(plan.checkpoint_path)
+        os.replace(temp_path, path)
+        return plan
+
+    @classmethod
+    def from_notes(cls, path: str, notes: List[Dict]) -> 'SyncPlan':
+        """
+        Write a plan creating the decks of the given notes and then adding the notes.
+
+        Args:
+            path: Path to the plan's JSONL file
+            notes: Notes built with AnkiConnector.build_note
+
+        Returns:
+            The new plan
+        """
+        deck_names = list(dict.fromkeys(note['deckName'] for note in notes))
+        instructions = [{'action': CREATE_DECK, 'params': {'deck': deck_name}} for deck_name in deck_names]
+        instructions.extend({'action': ADD_NOTE, 'params': {'note': note}} for note in notes)
+        return cls.create(path, instructions)
+
+    def instructions(self) -> Iterator[SyncInstruction]:
+        """Iterate over the instructions of the plan"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    data = json.loads(line)
+                    yield SyncInstruction(data['seq'], data['action'], data['params'])
+
+    def checkpoints(self) -> Dict[int, Dict]:
+        """Get the checkpoints recorded so far, keyed by instruction seq"""
+        checkpoints = {}
+        if not os.path.exists(self.checkpoint_path):
+            return checkpoints
+
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    # Torn last line of an interrupted write
+                    continue
+                checkpoints[data['seq']] = data
+        return checkpoints
+
+    def note_ids(self) -> Dict[int, int]:
+        """Get the ids of the notes of addNote instructions in Anki, keyed by instruction seq"""
+        return {
+            seq: checkpoint['result'] for seq, checkpoint in self.checkpoints().items()
+            if checkpoint.get('result') is not None and checkpoint.get('status') != STATUS_FAILED
+        }
+
+    def execute(self, anki: AnkiConnector, batch_size: int = 100) -> SyncPlanResult:
+        """
+        Execute the instructions that have no checkpoint yet.
+
+        Args:
+            anki: Connector of the target Anki instance
+            batch_size: Maximum number of addNote instructions per addNotes request
+
+        Returns:
+            Result of this execution
+        """
+        done = self.checkpoints()
+        result = SyncPlanResult(already_done=len(done))
+        # An earlier run may have stopped during its first request, before writing any checkpoint
+        verify_next_batch = os.path.exists(self.checkpoint_path)
+
+        with open(self.checkpoint_path, 'a', encoding='utf-8') as journal:
+            if not self._ends_with_newline():
+                # Keep new checkpoints off the torn line of an interrupted write
+                journal.write('\n')
+
+            batch = []
+            for instruction in self.instructions():
+                if instruction.seq in done:
+                    continue
+
+                if instruction.action == ADD_NOTE:
+                    batch.append(instruction)
+                    if len(batch) >= batch_size:
+                        self._add_notes(anki, batch, journal, result, verify_next_batch)
+                        verify_next_batch = False
+                        batch = []
+                    continue
+
+                if batch:
+                    self._add_notes(anki, batch, journal, result, verify_next_batch)
+                    verify_next_batch = False
+                    batch = []
+                self._apply(anki, instruction, journal, result)
+
+            if batch:
+                self._add_notes(anki, batch, journal, result, verify_next_batch)
+
+        return result
+
+    def _apply(self, anki: AnkiConnector, instruction: SyncInstruction, journal, result: SyncPlanResult) -> None:
+        if instruction.action == CREATE_DECK:
+            value = anki.create_deck(instruction.params['deck'])
+        elif instruction.action == UPDATE_NOTE_FIELDS:
+            note = instruction.params['note']
+            value = anki.update_note_fields(note['id'], note['fields'])
+        else:
+            raise ValueError(f"Unknown sync plan action '{instruction.action}'")
+
+        self._checkpoint(journal, [{'seq': instruction.seq, 'result': value}])
+        result.applied += 1
+
+    def _add_notes(self, anki: AnkiConnector, batch: List[SyncInstruction], journal,
+                   result: SyncPlanResult, verify: bool) -> None:
+        checkpoints = []
+        refused = []
+
+        if verify:
+            # Notes of this batch may have been added before the previous run stopped
+            can_add = anki.can_add_notes([instruction.params['note'] for instruction in batch])
+            refused = [instruction for instruction, ok in zip(batch, can_add) if not ok]
+            batch = [instruction for instruction, ok in zip(batch, can_add) if ok]
+
+        if batch:
+            note_ids = anki.try_add_notes([instruction.params['note'] for instruction in batch])
+            for instruction, note_id in zip(batch, note_ids):
+                if note_id is None:
+                    refused.append(instruction)
+                else:
+                    checkpoints.append({'seq': instruction.seq, 'result': note_id})
+                    result.applied += 1
+
+        for instruction in refused:
+            note_id = self._find_note_id(anki, instruction.params['note'])
+            if note_id is None:
+                checkpoints.append({'seq': instruction.seq, 'result': None, 'status': STATUS_FAILED})
+                result.failed += 1
+            else:
+                checkpoints.append({'seq': instruction.seq, 'result': note_id, 'status': STATUS_DUPLICATE})
+                result.duplicates += 1
+
+        self._checkpoint(journal, checkpoints)
+
+    def _find_note_id(self, anki: AnkiConnector, note: Dict):
+        """Find the note in Anki that a refused note duplicates, None if there is no single match"""
+        query = ' '.join(f'"{_escape_search(term)}"' for term in (
+            f"deck:{note['deckName']}",
+            f"note:{note['modelName']}",
+            f"front:{note['fields']['Front']}",
+        ))
+        note_ids = anki.find_notes(query)
+        return note_ids[0] if len(note_ids) == 1 else None
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.checkpoint_path, 'rb') as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _checkpoint(self, journal, checkpoints: List[Dict]) -> None:
+        """Durably record applied instructions"""
+        if not checkpoints:
+            return
+        journal.write(''.join(_dump(checkpoint) + '\n' for checkpoint in checkpoints))
+        journal.flush()
+        os.fsync(journal.fileno())
+
+
+def demo_sync_plan(vault_root: str = '.', plan_path: str = 'sync_plan.jsonl'):
+    """Push every flashcard of a vault through a resumable sync plan"""
+    from deck_inference import DeckInferenceEngine, create_example_config
+    from media_sync import MediaUploader
+    from vault_reader import VaultReader
+
+    anki = AnkiConnector()
+    if not anki.check_connection():
+        return
+
+    if os.path.exists(plan_path):
+        print(f"Resuming {plan_path}")
+        plan = SyncPlan(plan_path)
+    else:
+        engine = DeckInferenceEngine(create_example_config())
+        media_uploader = MediaUploader(anki, vault_root, os.path.join(vault_root, '.ankisync_media.json'))
+        notes = []
+        for _, flashcards in VaultReader(vault_root).iter_flashcards():
+            for card in flashcards:
+                front, back = media_uploader.prepare_fields(card)
+                notes.append(anki.build_note(engine.infer_deck(card.file_path, card.tags), front, back, card.tags))
+        media_uploader.save()
+        plan = SyncPlan.from_notes(plan_path, notes)
+
+    result = plan.execute(anki)
+    print(f"Applied: {result.applied}, already done: {result.already_done}")
+    print(f"Duplicates: {result.duplicates}, failed: {result.failed}")
+
+
+if __name__ == "__main__":
+    import sys
+    demo_sync_plan(sys.argv[1] if len(sys.argv) > 1 else '.')
@@ -0,0 +1,317 @@
+"""
+Sync Pipeline for AnkiSync
+Runs parsing, deck inference, diffing and pushing to Anki as concurrent stages.
+"""
+
+import os
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from anki_sync import AnkiConnector
+from deck_inference import DeckInferenceEngine
+from duplicate_index import DuplicateIndex
+from media_sync import MediaUploader
+from obsidian_parser import Flashcard, ObsidianFlashcardParser
+from vault_reader import VaultFile
+
+
+@dataclass
+class PendingNote:
+    """A flashcard with its inferred deck and AnkiConnect note"""
+    card: Flashcard
+    deck_name: str
+    note: Dict
+
+
+@dataclass
+class FileBatch:
+    """The flashcards of one file as they move through the pipeline"""
+    file_path: str
+    cards: List[Flashcard]
+    notes: List[PendingNote] = field(default_factory=list)
+
+
+@dataclass
+class PipelineResult:
+    """Outcome of a pipeline run"""
+    files: int = 0
+    cards: int = 0
+    duplicates: int = 0  # Cards with the same front as an earlier card of the run, dropped before upload
+    skipped: int = 0  # Notes Anki reported it cannot add, e.g. duplicates
+    added: int = 0
+    failed: int = 0
+    note_ids: List[int] = field(default_factory=list)
+    cancelled: bool = False
+
+
+class PipelineCancelled(Exception):
+    """Raised inside a stage when the pipeline was cancelled"""
+
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class SyncPipeline:
+    """
+    Pipeline pushing vault flashcards to Anki.
+
+    Stages run in their own threads, connected by bounded queues:
+    - parse: parse files and extract their tags
+    - infer: drop cards repeating the front of an earlier card of the run, then
+      infer the deck of each card and build its note, uploading its media and
+      rewriting the media references if a MediaUploader is given
+    - diff: create missing decks and drop notes Anki cannot add
+    - push: add the remaining notes, coalescing small files into larger requests
+
+    A full queue blocks the stage feeding it, so a slow Anki throttles parsing
+    instead of buffering the whole vault. Notes of the first files are pushed
+    while later files are still being parsed. cancel() stops all stages after
+    their current item; a stage error cancels the run and is re-raised by run().
+    """
+
+    def __init__(self, anki: AnkiConnector, engine: DeckInferenceEngine,
+                 parser: Optional[ObsidianFlashcardParser] = None,
+                 queue_size: int = 8, push_batch_size: int = 100, skip_duplicates: bool = False,
+                 media_uploader: Optional[MediaUploader] = None):
+        """
+        Initialize the sync pipeline.
+
+        Args:
+            anki: Connector of the target Anki instance
+            engine: Deck inference engine for the target
+            parser: Parser used by the parse stage
+            queue_size: Number of file batches each queue holds before blocking
+            push_batch_size: Maximum number of notes per addNotes request
+            skip_duplicates: Also drop cards whose front matches an earlier one only after
+                normalization (see DuplicateIndex); identical fronts are always dropped
+            media_uploader: Uploader for the media of the cards, with the manifest of this Anki instance
+        """
+        self.anki = anki
+        self.engine = engine
+        self.parser = parser or ObsidianFlashcardParser()
+        self.queue_size = queue_size
+        self.push_batch_size = push_batch_size
+        self.skip_duplicates = skip_duplicates
+        self.duplicate_index: Optional[DuplicateIndex] = None
+        self.media_uploader = media_uploader
+
+        self._cancelled = threading.Event()
+        self._errors: List[BaseException] = []
+        self._result = PipelineResult()
+
+    @property
+    def result(self) -> PipelineResult:
+        """Result of the current or last run, partial if the run failed"""
+        return self._result
+
+    def cancel(self) -> None:
+        """Stop the pipeline after the items currently being processed"""
+        self._cancelled.set()
+
+    def run(self, files: Iterable[VaultFile]) -> PipelineResult:
+        """
+        Parse and push the flashcards of the given files.
+
+        Args:
+            files: Files to sync, e.g. a VaultReader
+
+        Returns:
+            Result of the run
+        """
+        return self._run([self._parse_stage, self._infer_stage, self._diff_stage, self._push_stage], files)
+
+    def run_parsed(self, batches: Iterable[FileBatch]) -> PipelineResult:
+        """
+        Push flashcards that were already parsed, skipping the parse stage.
+
+        The flashcards are not modified, so the same batches can be pushed to several targets.
+
+        Args:
+            batches: Parsed flashcards per file
+
+        Returns:
+            Result of the run
+        """
+        return self._run([self._feed_stage, self._infer_stage, self._diff_stage, self._push_stage], batches)
+
+    def _run(self, stages: List[Callable], source: Iterable) -> PipelineResult:
+        # The cancel flag is reset when a run ends, not here, so a cancel() that
+        # arrives before the run starts still stops it
+        self._errors = []
+        self._result = PipelineResult()
+        self.duplicate_index = DuplicateIndex() if self.skip_duplicates else None
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in stages[1:]]
+        inputs = [source] + queues
+        outputs = queues + [None]
+
+        threads = [
+            threading.Thread(target=self._run_stage, args=(stage, inputs[i], outputs[i]),
+                             name=f"sync-{stage.__name__.strip('_')}", daemon=True)
+            for i, stage in enumerate(stages)
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            try:
+                for thread in threads:
+                    thread.join()
+            except KeyboardInterrupt:
+                self.cancel()
+                for thread in threads:
+                    thread.join()
+                raise
+
+            if self._errors:
+                raise self._errors[0]
+
+            self._result.cancelled = self._cancelled.is_set()
+            return self._result
+        finally:
+            if self.media_uploader is not None:
+                self.media_uploader.save()
+            self._cancelled.clear()
+
+    def _run_stage(self, stage: Callable, source, target: Optional[queue.Queue]) -> None:
+        try:
+            stage(source, target)
+            if target is not None:
+                self._put(target, _DONE)
+        except PipelineCancelled:
+            pass
+        except Exception as e:
+            self._errors.append(e)
+            self.cancel()
+
+    def _put(self, target: queue.Queue, item) -> None:
+        """Put an item on a queue, waiting while it is full unless the pipeline is cancelled"""
+        while True:
+            if self._cancelled.is_set():
+                raise PipelineCancelled()
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _iter_queue(self, source: queue.Queue):
+        """Iterate over the items of a queue until its producer is done or the pipeline is cancelled"""
+        while True:
+            if self._cancelled.is_set():
+                raise PipelineCancelled()
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def _parse_stage(self, files: Iterable[VaultFile], target: queue.Queue) -> None:
+        for vault_file in files:
+            if self._cancelled.is_set():
+                raise PipelineCancelled()
+            cards = self.parser.parse_file(vault_file.path, vault_file.content)
+            self.parser.extract_tags_and_deck_for_file(cards, vault_file.content)
+            self._result.files += 1
+            if cards:
+                self._put(target, FileBatch(vault_file.path, cards))
+
+    def _feed_stage(self, batches: Iterable[FileBatch], target: queue.Queue) -> None:
+        for batch in batches:
+            self._result.files += 1
+            if batch.cards:
+                # Fresh batch, so per-target notes never leak into the shared one
+                self._put(target, FileBatch(batch.file_path, batch.cards))
+
+    def _infer_stage(self, source: queue.Queue, target: queue.Queue) -> None:
+        # canAddNotes only knows notes already in Anki, not those of earlier batches still queued for push.
+        # Checked before any media is uploaded, so duplicates cause no network I/O
+        seen_fronts = set()
+        for batch in self._iter_queue(source):
+            for card in batch.cards:
+                if self.duplicate_index is not None:
+                    is_duplicate = self.duplicate_index.add(card) is not None
+                else:
+                    is_duplicate = card.front in seen_fronts
+                    seen_fronts.add(card.front)
+                if is_duplicate:
+                    self._result.duplicates += 1
+                    continue
+
+                deck_name = self.engine.infer_deck(card.file_path, card.tags)
+                if self.media_uploader is not None:
+                    front, back = self.media_uploader.prepare_fields(card)
+                else:
+                    front, back = card.front, card.back
+                note = self.anki.build_note(deck_name, front, back, list(card.tags))
+                batch.notes.append(PendingNote(card, deck_name, note))
+            self._result.cards += len(batch.cards)
+            if batch.notes:
+                self._put(target, batch)
+
+    def _diff_stage(self, source: queue.Queue, target: queue.Queue) -> None:
+        known_decks = set(self.anki.get_deck_names())
+        for batch in self._iter_queue(source):
+            for deck_name in {pending.deck_name for pending in batch.notes} - known_decks:
+                self.anki.create_deck(deck_name)
+                known_decks.add(deck_name)
+
+            can_add = self.anki.can_add_notes([pending.note for pending in batch.notes])
+            addable = [pending for pending, ok in zip(batch.notes, can_add) if ok]
+            self._result.skipped += len(batch.notes) - len(addable)
+
+            if addable:
+                batch.notes = addable
+                self._put(target, batch)
+
+    def _push_stage(self, source: queue.Queue, target: None) -> None:
+        size = self.push_batch_size
+        pending_notes = []
+        for batch in self._iter_queue(source):
+            pending_notes.extend(batch.notes)
+            while len(pending_notes) >= size:
+                self._push(pending_notes[:size])
+                del pending_notes[:size]
+
+            # Coalesce small files into one request while more batches are already waiting
+            if pending_notes and source.empty():
+                self._push(pending_notes)
+                pending_notes = []
+
+        if pending_notes:
+            self._push(pending_notes)
+
+    def _push(self, chunk: List[PendingNote]) -> None:
+        note_ids = self.anki.try_add_notes([pending.note for pending in chunk])
+        for note_id in note_ids:
+            if note_id is None:
+                self._result.failed += 1
+            else:
+                self._result.added += 1
+                self._result.note_ids.append(note_id)
+
+
+def demo_sync_pipeline(vault_root: str = '.'):
+    """Push every flashcard of a vault to the local Anki instance"""
+    from deck_inference import create_example_config
+    from vault_reader import VaultReader
+
+    anki = AnkiConnector()
+    if not anki.check_connection():
+        return
+
+    media_uploader = MediaUploader(anki, vault_root, os.path.join(vault_root, '.ankisync_media.json'))
+    pipeline = SyncPipeline(anki, DeckInferenceEngine(create_example_config()), media_uploader=media_uploader)
+    result = pipeline.run(VaultReader(vault_root))
+
+    print(f"Files: {result.files}, cards: {result.cards}")
+    print(f"Added: {result.added}, skipped: {result.skipped}, failed: {result.failed}")
+
+
+if __name__ == "__main__":
+    import sys
+    demo_sync_pipeline(sys.argv[1] if len(sys.argv) > 1 else '.')
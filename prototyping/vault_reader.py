@@ -0,0 +1,163 @@
+"""
+Vault Reader for AnkiSync
+Reads the markdown files of an Obsidian vault, skipping files without flashcards
+before they are decoded.
+"""
+
+import mmap
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+from obsidian_parser import Flashcard, ObsidianFlashcardParser
+
+
+@dataclass
+class VaultFile:
+    """A vault file that may contain flashcards"""
+    path: str
+    content: str
+
+
+class VaultReader:
+    """
+    Reader for the markdown files of a vault.
+
+    Files are scanned as raw bytes for the markers a flashcard needs before
+    anything is decoded:
+    - the single-line separator (::, which also covers :::)
+    - a ? at the end of a line (multi-line cards, including ??)
+    - the parser's cloze delimiter
+
+    Files without any of them are skipped. Files at or above mmap_threshold are
+    memory-mapped, scanned in place and decoded straight from the mapping.
+    Files that cannot be read or are not valid UTF-8 are recorded in errors
+    and skipped, so a single bad file does not stop a scan of the vault.
+    """
+
+    def __init__(self, vault_root: str, parser: Optional[ObsidianFlashcardParser] = None,
+                 extensions: Tuple[str, ...] = ('.md',), mmap_threshold: int = 64 * 1024):
+        """
+        Initialize the vault reader.
+
+        Args:
+            vault_root: Root folder of the vault
+            parser: Parser whose separators are used by the prefilter
+            extensions: File extensions to read
+            mmap_threshold: Size in bytes from which files are memory-mapped
+        """
+        self.vault_root = vault_root
+        self.parser = parser or ObsidianFlashcardParser()
+        self.extensions = extensions
+        self.mmap_threshold = mmap_threshold
+
+        self.files_read = 0
+        self.files_skipped = 0
+        self.errors: List[Tuple[str, str]] = []  # (path, error message) of unreadable files
+
+        self._compile_markers()
+
+    def _compile_markers(self):
+        """Compile the bytes-level card marker prefilter"""
+        single_line = re.escape(self.parser.single_line_separator.encode('utf-8'))
+        multi_line = re.escape(self.parser.multi_line_separator.encode('utf-8'))
+        self._line_marker_pattern = re.compile(
+            single_line + rb'|' + multi_line + rb'[ \t\r]*$',
+            re.MULTILINE
+        )
+        self._cloze_marker = self.parser.cloze_delimiter.encode('utf-8')
+
+    def has_card_markers(self, data) -> bool:
+        """
+        Check whether raw file data contains any flashcard marker.
+
+        Args:
+            data: bytes, or any buffer such as an mmap
+
+        Returns:
+            False if the data cannot contain a flashcard
+        """
+        if data.find(self._cloze_marker) != -1:
+            return True
+        return self._line_marker_pattern.search(data) is not None
+
+    def iter_paths(self) -> Iterator[str]:
+        """Iterate over the paths of all vault files with a matching extension"""
+        for dir_path, dir_names, file_names in os.walk(self.vault_root):
+            # Skip hidden folders such as .obsidian and .git
+            dir_names[:] = sorted(name for name in dir_names if not name.startswith('.'))
+            for file_name in sorted(file_names):
+                if file_name.endswith(self.extensions):
+                    yield os.path.join(dir_path, file_name)
+
+    def read(self, path: str) -> Optional[str]:
+        """
+        Read a file if it may contain flashcards.
+
+        Args:
+            path: Path to the file
+
+        Returns:
+            Decoded file content, or None if the file has no card markers
+        """
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                content = None
+            elif size < self.mmap_threshold:
+                data = f.read()
+                content = data.decode('utf-8') if self.has_card_markers(data) else None
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    content = str(mapped, 'utf-8') if self.has_card_markers(mapped) else None
+
+        if content is None:
+            self.files_skipped += 1
+            return None
+
+        self.files_read += 1
+        if '\r' in content:
+            content = content.replace('\r\n', '\n')
+        return content
+
+    def __iter__(self) -> Iterator[VaultFile]:
+        """Iterate over the vault files that may contain flashcards"""
+        for path in self.iter_paths():
+            try:
+                content = self.read(path)
+            except (OSError, UnicodeDecodeError) as e:
+                # Removed since the walk, unreadable or not UTF-8; the message
+                # is kept rather than the error, which holds the file's bytes
+                self.errors.append((path, str(e)))
+                continue
+            if content is not None:
+                yield VaultFile(path, content)
+
+    def iter_flashcards(self) -> Iterator[Tuple[VaultFile, List[Flashcard]]]:
+        """Iterate over the vault files with their parsed, tagged flashcards"""
+        for vault_file in self:
+            flashcards = self.parser.parse_file(vault_file.path, vault_file.content)
+            self.parser.extract_tags_and_deck_for_file(flashcards, vault_file.content)
+            yield vault_file, flashcards
+
+
+def demo_vault_reader(vault_root: str = '.'):
+    """Parse every file of a vault and report how many were skipped"""
+    reader = VaultReader(vault_root)
+
+    total = 0
+    for vault_file, flashcards in reader.iter_flashcards():
+        if flashcards:
+            print(f"{vault_file.path}: {len(flashcards)} flashcards")
+        total += len(flashcards)
+
+    print(f"\nFound {total} flashcards")
+    print(f"Files read: {reader.files_read}, skipped: {reader.files_skipped}")
+    for path, error in reader.errors:
+        print(f"Could not read {path}: {error}")
+
+
+if __name__ == "__main__":
+    import sys
+    demo_vault_reader(sys.argv[1] if len(sys.argv) > 1 else '.')